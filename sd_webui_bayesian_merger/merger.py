@@ -1,16 +1,17 @@
 import os
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
 
 import safetensors.torch
 import torch
 from omegaconf import DictConfig
 from tqdm import tqdm
 
-from sd_webui_bayesian_merger.model import SDModel
+from sd_webui_bayesian_merger.model import LazyStateDict, SDModel
 
 PathT = os.PathLike
 
@@ -31,6 +32,13 @@ KEY_POSITION_IDS = ".".join(
     ]
 )
 
+# constant across keys and models; built once instead of per use
+POSITION_IDS = torch.tensor([list(range(MAX_TOKENS))], dtype=torch.int64)
+
+KEY_INPUT_BLOCKS = ".input_blocks."  # 12
+KEY_MIDDLE_BLOCK = ".middle_block."  # 1
+KEY_OUTPUT_BLOCKS = ".output_blocks."  # 12
+
 NUM_MODELS_NEEDED = {
     "add_difference": 3,
     "weighted_sum": 2,
@@ -46,12 +54,94 @@ NAI_KEYS = {
     "cond_stage_model.transformer.final_layer_norm.": "cond_stage_model.transformer.text_model.final_layer_norm.",
 }
 
+RE_NAI_KEYS = re.compile("|".join(map(re.escape, NAI_KEYS)))
+
+
+# scripted so TorchScript can fuse the elementwise chains into a single
+# kernel and skip Python dispatch on every tensor
+@torch.jit.script
+def _weighted_sum(t0: torch.Tensor, t1: torch.Tensor, alpha: float) -> torch.Tensor:
+    # lerp neither type-promotes nor has an integer kernel, so match the
+    # plain expression's promotion on mixed-precision inputs first
+    dtype = torch.promote_types(t0.dtype, t1.dtype)
+    t0, t1 = t0.to(dtype), t1.to(dtype)
+    if not t0.is_floating_point():
+        t0, t1 = t0.float(), t1.float()
+    # fused kernel: one pass over memory, stays in the promoted dtype
+    return torch.lerp(t0, t1, alpha)
+
+
+@torch.jit.script
+def _weighted_subtraction(
+    t0: torch.Tensor, t1: torch.Tensor, alpha: float, beta: float
+) -> torch.Tensor:
+    # Adjust beta if both alpha and beta are 1.0 to avoid division by zero
+    # (EPSILON inlined: TorchScript cannot close over module globals)
+    if alpha == 1.0 and beta == 1.0:
+        beta -= 1e-10
+    dtype = torch.promote_types(t0.dtype, t1.dtype)
+    t0, t1 = t0.to(dtype), t1.to(dtype)
+    if not t0.is_floating_point():
+        return (t0 - alpha * beta * t1) / (1 - alpha * beta)
+    return torch.sub(t0, t1, alpha=alpha * beta).div_(1 - alpha * beta)
+
+
+@torch.jit.script
+def _tensor_sum(
+    t0: torch.Tensor, t1: torch.Tensor, alpha: float, beta: float
+) -> torch.Tensor:
+    if alpha + beta <= 1:
+        tt = t0.clone()
+        talphas = int(t0.shape[0] * beta)
+        talphae = int(t0.shape[0] * (alpha + beta))
+        tt[talphas:talphae] = t1[talphas:talphae].clone()
+        return tt
+    talphas = int(t0.shape[0] * (alpha + beta - 1))
+    talphae = int(t0.shape[0] * beta)
+    tt = t1.clone()
+    tt[talphas:talphae] = t0[talphas:talphae].clone()
+    return tt
+
+
+@torch.jit.script
+def _add_difference(
+    t0: torch.Tensor, t1: torch.Tensor, t2: torch.Tensor, alpha: float
+) -> torch.Tensor:
+    # promote up front: the in-place chain would otherwise keep the
+    # narrowest operand dtype instead of the widest, unlike the baseline
+    dtype = torch.promote_types(torch.promote_types(t0.dtype, t1.dtype), t2.dtype)
+    t0, t1, t2 = t0.to(dtype), t1.to(dtype), t2.to(dtype)
+    if not t0.is_floating_point():
+        return t0 + alpha * (t1 - t2)
+    # one temporary, mutated in place, instead of three
+    return t1.sub(t2).mul_(alpha).add_(t0)
+
+
+@torch.jit.script
+def _sum_twice(
+    t0: torch.Tensor, t1: torch.Tensor, t2: torch.Tensor, alpha: float, beta: float
+) -> torch.Tensor:
+    dtype = torch.promote_types(torch.promote_types(t0.dtype, t1.dtype), t2.dtype)
+    t0, t1, t2 = t0.to(dtype), t1.to(dtype), t2.to(dtype)
+    if not t0.is_floating_point():
+        t0, t1, t2 = t0.float(), t1.float(), t2.float()
+    return torch.lerp(torch.lerp(t0, t1, alpha), t2, beta)
+
+
+@torch.jit.script
+def _triple_sum(
+    t0: torch.Tensor, t1: torch.Tensor, t2: torch.Tensor, alpha: float, beta: float
+) -> torch.Tensor:
+    dtype = torch.promote_types(torch.promote_types(t0.dtype, t1.dtype), t2.dtype)
+    t0, t1, t2 = t0.to(dtype), t1.to(dtype), t2.to(dtype)
+    if not t0.is_floating_point():
+        return (1 - alpha - beta) * t0 + alpha * t1 + beta * t2
+    return t0.mul(1 - alpha - beta).add_(t1, alpha=alpha).add_(t2, alpha=beta)
+
 
 def fix_clip(model: Dict) -> Dict:
     if KEY_POSITION_IDS in model:
-        model[KEY_POSITION_IDS] = torch.tensor(
-            [list(range(MAX_TOKENS))], dtype=torch.int64
-        )
+        model[KEY_POSITION_IDS] = POSITION_IDS
 
     return model
 
@@ -66,7 +156,9 @@ def fix_key(model: Dict, key: str) -> Dict:
 
 
 def fix_nai_keys(model: Dict) -> Dict:
-    for k in model:
+    # single DFA match per key, and no mutation while iterating the model
+    nai_keys = [k for k in model.keys() if RE_NAI_KEYS.match(k)]
+    for k in nai_keys:
         model = fix_key(model, k)
 
     return model
@@ -162,24 +254,19 @@ class Merger:
         self,
         key: str,
         thetas: Dict,
-        weights: Dict,
+        base_cache: List[Dict],
         bases: Dict,
-        best: bool,
+        merge_mode: str,
+        skip_position_ids: int,
     ) -> Tuple[str, Dict]:
         if KEY_POSITION_IDS in key:
-            if self.cfg.skip_position_ids == 1:
-                if not best or self.cfg.best_precision == "16":
-                    return (key, thetas["model_a"][key].half())
+            if skip_position_ids == 1:
                 return (
                     key,
                     thetas["model_a"][key],
                 )  # Skip position_ids key to eject effect. Value of Model A used.
-            elif self.cfg.skip_position_ids == 2:
-                thetas["model_a"][key] = torch.tensor(
-                    [list(range(MAX_TOKENS))], dtype=torch.int64
-                )
-                if not best or self.cfg.best_precision == "16":
-                    return (key, thetas["model_a"][key].half())
+            elif skip_position_ids == 2:
+                thetas["model_a"][key] = POSITION_IDS
                 return (key, thetas["model_a"][key])
         for theta in thetas.values():
             if key not in theta:
@@ -188,105 +275,139 @@ class Merger:
         if "model.diffusion_model." in key:
             weight_index = -1
 
-            re_inp = re.compile(r"\.input_blocks\.(\d+)\.")  # 12
-            re_mid = re.compile(r"\.middle_block\.(\d+)\.")  # 1
-            re_out = re.compile(r"\.output_blocks\.(\d+)\.")  # 12
-
             if "time_embed" in key:
                 weight_index = 0  # before input blocks
             elif ".out." in key:
                 weight_index = NUM_TOTAL_BLOCKS - 1  # after output blocks
-            elif m := re_inp.search(key):
-                weight_index = int(m.groups()[0])
-            elif re_mid.search(key):
+            elif (i := key.find(KEY_INPUT_BLOCKS)) != -1:
+                i += len(KEY_INPUT_BLOCKS)
+                weight_index = int(key[i : key.index(".", i)])
+            elif KEY_MIDDLE_BLOCK in key:
                 weight_index = NUM_INPUT_BLOCKS
-            elif m := re_out.search(key):
-                weight_index = NUM_INPUT_BLOCKS + NUM_MID_BLOCK + int(m.groups()[0])
+            elif (i := key.find(KEY_OUTPUT_BLOCKS)) != -1:
+                i += len(KEY_OUTPUT_BLOCKS)
+                weight_index = (
+                    NUM_INPUT_BLOCKS + NUM_MID_BLOCK + int(key[i : key.index(".", i)])
+                )
 
             if weight_index >= NUM_TOTAL_BLOCKS:
                 raise ValueError(f"illegal block index {key}")
 
             if weight_index >= 0:
-                current_bases = {k: w[weight_index] for k, w in weights.items()}
-
-        merged = self.merge_block(current_bases, thetas, key)
-
-        if not best or self.cfg.best_precision == "16":
-            merged = merged.half()
+                current_bases = base_cache[weight_index]
 
-        return (key, merged)
+        return (key, self.merge_block(current_bases, thetas, key, merge_mode))
 
-    def merge_block(self, current_bases: Dict, thetas: Dict, key: str) -> Dict:
+    def merge_block(
+        self, current_bases: Dict, thetas: Dict, key: str, merge_mode: str
+    ) -> Dict:
         t0 = thetas["model_a"][key]
         t1 = thetas["model_b"][key]
-        alpha = current_bases["alpha"]
-        if self.cfg.merge_mode == "weighted_sum":
-            return (1 - alpha) * t0 + alpha * t1
-        elif self.cfg.merge_mode == "weighted_subtraction":
-            beta = current_bases["beta"]
-            # Adjust beta if both alpha and beta are 1.0 to avoid division by zero
-            if alpha == 1.0 and beta == 1.0:
-                beta -= EPSILON
-            return (t0 - alpha * beta * t1) / (1 - alpha * beta)
-        elif self.cfg.merge_mode == "tensor_sum":
-            beta = current_bases["beta"]
-            if alpha + beta <= 1:
-                tt = t0.clone()
-                talphas = int(t0.shape[0] * (beta))
-                talphae = int(t0.shape[0] * (alpha + beta))
-                tt[talphas:talphae] = t1[talphas:talphae].clone()
-                return tt
-            else:
-                talphas = int(t0.shape[0] * (alpha + beta - 1))
-                talphae = int(t0.shape[0] * (beta))
-                tt = t1.clone()
-                tt[talphas:talphae] = t0[talphas:talphae].clone()
-                return tt
+        alpha = float(current_bases["alpha"])
+        if merge_mode == "weighted_sum":
+            return _weighted_sum(t0, t1, alpha)
+        elif merge_mode == "weighted_subtraction":
+            return _weighted_subtraction(t0, t1, alpha, float(current_bases["beta"]))
+        elif merge_mode == "tensor_sum":
+            return _tensor_sum(t0, t1, alpha, float(current_bases["beta"]))
         t2 = thetas["model_c"][key]
-        if self.cfg.merge_mode == "add_difference":
-            return t0 + alpha * (t1 - t2)
-        beta = current_bases["beta"]
-        if self.cfg.merge_mode == "sum_twice":
-            return (1 - beta) * ((1 - alpha) * t0 + alpha * t1) + beta * t2
-        elif self.cfg.merge_mode == "triple_sum":
-            return (1 - alpha - beta) * t0 + alpha * t1 + beta * t2
-
+        if merge_mode == "add_difference":
+            return _add_difference(t0, t1, t2, alpha)
+        beta = float(current_bases["beta"])
+        if merge_mode == "sum_twice":
+            return _sum_twice(t0, t1, t2, alpha, beta)
+        elif merge_mode == "triple_sum":
+            return _triple_sum(t0, t1, t2, alpha, beta)
+
+    @torch.inference_mode()
     def merge(
         self,
         weights: Dict,
         bases: Dict,
         best: bool = False,
     ) -> None:
-        thetas = {k: self.load_sd_model(m) for k, m in self.models.items()}
-
-        for key in tqdm(thetas["model_a"].keys(), desc="stage 1"):
-            if result := self.merge_key(
-                key,
-                thetas,
-                weights,
-                bases,
-                best,
+        with ThreadPoolExecutor(max_workers=len(self.models)) as executor:
+            thetas = dict(
+                zip(
+                    self.models.keys(),
+                    executor.map(self.load_sd_model, self.models.values()),
+                )
+            )
+
+        base_cache = [
+            {k: w[i] for k, w in weights.items()} for i in range(NUM_TOTAL_BLOCKS)
+        ]
+
+        # hoisted out of the hot loops: each self.cfg access goes through
+        # OmegaConf's __getattr__, which is orders of magnitude slower than
+        # a local
+        merge_mode = str(self.cfg.merge_mode)
+        skip_position_ids = int(self.cfg.skip_position_ids)
+
+        keys = list(thetas["model_a"].keys())
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for result in tqdm(
+                executor.map(
+                    lambda key: self.merge_key(
+                        key,
+                        thetas,
+                        base_cache,
+                        bases,
+                        merge_mode,
+                        skip_position_ids,
+                    ),
+                    keys,
+                ),
+                total=len(keys),
+                desc="stage 1",
             ):
-                thetas["model_a"][key] = result[1]
-
-        for key in tqdm(thetas["model_b"].keys(), desc="stage 2"):
-            if "model" in key and key not in thetas["model_a"]:
-                if KEY_POSITION_IDS in key:
-                    if self.cfg.skip_position_ids == 1:
-                        continue
-                    elif self.cfg.skip_position_ids == 2:
-                        thetas["model_a"][key] = torch.tensor(
-                            [list(range(MAX_TOKENS))], dtype=torch.int64
-                        )
-                        if not best or self.cfg.best_precision == "16":
-                            thetas["model_a"][key] = thetas["model_a"][key].half()
-                        continue
-                thetas["model_a"].update({key: thetas["model_b"][key]})
-                if not best or self.cfg.best_precision == "16":
-                    thetas["model_a"][key] = thetas["model_a"][key].half()
+                if result:
+                    thetas["model_a"][result[0]] = result[1]
+                    # the sources for this key are no longer needed; freeing
+                    # them keeps the working set at ~one model instead of N+1
+                    for model_key in self.model_keys[1:]:
+                        theta = thetas[model_key]
+                        if isinstance(theta, LazyStateDict):
+                            theta.discard(result[0])
+                        else:
+                            theta.pop(result[0], None)
+
+        leftover_keys = thetas["model_b"].keys() - thetas["model_a"].keys()
+        for key in tqdm(leftover_keys, desc="stage 2"):
+            if "model" not in key:
+                continue
+            if KEY_POSITION_IDS in key:
+                if skip_position_ids == 1:
+                    continue
+                elif skip_position_ids == 2:
+                    thetas["model_a"][key] = POSITION_IDS
+                    continue
+            thetas["model_a"][key] = thetas["model_b"][key]
+
+        for model_key in self.model_keys[1:]:
+            del thetas[model_key]
 
         thetas["model_a"] = fix_model(thetas["model_a"])
 
+        if not best or self.cfg.best_precision == "16":
+            thetas["model_a"] = {
+                k: v.half() if v.is_floating_point() else v
+                for k, v in thetas["model_a"].items()
+            }
+
+        if self.cfg.device != "cpu":
+            # merge happens on cfg.device; bring tensors back once for the writer
+            thetas["model_a"] = {k: v.cpu() for k, v in thetas["model_a"].items()}
+
+        if not isinstance(thetas["model_a"], dict):
+            # materialize whatever is still paged out on disk for the writer
+            thetas["model_a"] = dict(thetas["model_a"])
+
+        for k, v in thetas["model_a"].items():
+            # safetensors refuses non-contiguous tensors; repack only those
+            if not v.is_contiguous():
+                thetas["model_a"][k] = v.contiguous()
+
         if best:
             print(f"Saving {self.best_output_file}")
             if self.cfg.best_format == "safetensors":
@@ -1,4 +1,5 @@
 import os
+from collections.abc import MutableMapping
 from dataclasses import dataclass
 
 import safetensors
@@ -6,6 +7,63 @@ import torch
 
 PathT = os.PathLike
 
+_MISSING = object()
+
+
+class LazyStateDict(MutableMapping):
+    """Dict-like view over a safetensors checkpoint.
+
+    Tensors are paged in from disk on first access instead of eagerly at
+    load time. Writes and deletions go to an in-memory overlay, so the
+    resident set is only the tensors a merge actually touches, not the
+    whole checkpoint.
+    """
+
+    def __init__(self, model_path: PathT, device: str):
+        self._file = safetensors.safe_open(
+            model_path,
+            framework="pt",
+            device=device,
+        )
+        self._overlay = {}
+        self._disk_keys = {}  # fixed key -> name on disk
+        for name in self._file.keys():
+            if key := transform_checkpoint_dict_key(name):
+                self._disk_keys[key] = name
+
+    def __getitem__(self, key):
+        if key in self._overlay:
+            return self._overlay[key]
+        return self._file.get_tensor(self._disk_keys[key])
+
+    def __setitem__(self, key, value):
+        self._overlay[key] = value
+
+    def __delitem__(self, key):
+        found = self._overlay.pop(key, _MISSING) is not _MISSING
+        if self._disk_keys.pop(key, None) is not None:
+            found = True
+        if not found:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        # Mapping.__contains__ would call __getitem__ and page the tensor in
+        return key in self._overlay or key in self._disk_keys
+
+    def __iter__(self):
+        yield from self._disk_keys
+        for key in self._overlay:
+            if key not in self._disk_keys:
+                yield key
+
+    def __len__(self):
+        return len(self._disk_keys.keys() | self._overlay.keys())
+
+    def discard(self, key):
+        # unlike pop, dropping a key this way never materializes its tensor
+        self._overlay.pop(key, None)
+        self._disk_keys.pop(key, None)
+
 
 @dataclass
 class SDModel:
@@ -15,13 +73,9 @@ class SDModel:
     def load_model(self):
         print(f"loading: {self.model_path}")
         if self.model_path.suffix == ".safetensors":
-            ckpt = safetensors.torch.load_file(
-                self.model_path,
-                device=self.device,
-            )
-        else:
-            ckpt = torch.load(self.model_path, map_location=self.device)
+            return LazyStateDict(self.model_path, self.device)
 
+        ckpt = torch.load(self.model_path, map_location=self.device)
         return get_state_dict_from_checkpoint(ckpt)
 
 
@@ -0,0 +1,132 @@
+import pytest
+import torch
+
+from sd_webui_bayesian_merger.merger import (
+    _add_difference,
+    _sum_twice,
+    _tensor_sum,
+    _triple_sum,
+    _weighted_sum,
+    _weighted_subtraction,
+    fix_nai_keys,
+)
+
+ALPHA = 0.3
+BETA = 0.25
+
+PAIR_DTYPES = [
+    (torch.float32, torch.float32),
+    (torch.float16, torch.float16),
+    (torch.float32, torch.float16),
+    (torch.float16, torch.float32),
+    (torch.int64, torch.int64),
+]
+
+TRIPLE_DTYPES = [
+    (torch.float32, torch.float32, torch.float32),
+    (torch.float16, torch.float16, torch.float16),
+    (torch.float32, torch.float16, torch.float16),
+    (torch.float16, torch.float32, torch.float32),
+    (torch.int64, torch.int64, torch.int64),
+]
+
+
+def make_tensor(dtype):
+    if dtype == torch.int64:
+        return torch.randint(-5, 5, (8, 4), dtype=dtype)
+    return torch.randn(8, 4).to(dtype)
+
+
+def assert_matches_baseline(result, expected):
+    assert result.dtype == expected.dtype
+    assert torch.allclose(result.float(), expected.float(), atol=1e-2)
+
+
+@pytest.mark.parametrize(("dtype0", "dtype1"), PAIR_DTYPES)
+def test_weighted_sum(dtype0, dtype1):
+    t0, t1 = make_tensor(dtype0), make_tensor(dtype1)
+    expected = (1 - ALPHA) * t0 + ALPHA * t1
+    assert_matches_baseline(_weighted_sum(t0, t1, ALPHA), expected)
+
+
+@pytest.mark.parametrize(("dtype0", "dtype1"), PAIR_DTYPES)
+def test_weighted_subtraction(dtype0, dtype1):
+    t0, t1 = make_tensor(dtype0), make_tensor(dtype1)
+    expected = (t0 - ALPHA * BETA * t1) / (1 - ALPHA * BETA)
+    assert_matches_baseline(_weighted_subtraction(t0, t1, ALPHA, BETA), expected)
+
+
+def test_weighted_subtraction_unit_alpha_beta():
+    t0, t1 = torch.randn(8, 4), torch.randn(8, 4)
+    result = _weighted_subtraction(t0, t1, 1.0, 1.0)
+    assert torch.isfinite(result).all()
+
+
+@pytest.mark.parametrize(("alpha", "beta"), [(0.25, 0.5), (0.75, 0.5)])
+def test_tensor_sum(alpha, beta):
+    t0, t1 = torch.randn(8, 4), torch.randn(8, 4)
+    if alpha + beta <= 1:
+        expected = t0.clone()
+        talphas = int(t0.shape[0] * beta)
+        talphae = int(t0.shape[0] * (alpha + beta))
+        expected[talphas:talphae] = t1[talphas:talphae]
+    else:
+        expected = t1.clone()
+        talphas = int(t0.shape[0] * (alpha + beta - 1))
+        talphae = int(t0.shape[0] * beta)
+        expected[talphas:talphae] = t0[talphas:talphae]
+    assert_matches_baseline(_tensor_sum(t0, t1, alpha, beta), expected)
+
+
+@pytest.mark.parametrize(("dtype0", "dtype1", "dtype2"), TRIPLE_DTYPES)
+def test_add_difference(dtype0, dtype1, dtype2):
+    t0, t1, t2 = make_tensor(dtype0), make_tensor(dtype1), make_tensor(dtype2)
+    expected = t0 + ALPHA * (t1 - t2)
+    assert_matches_baseline(_add_difference(t0, t1, t2, ALPHA), expected)
+
+
+@pytest.mark.parametrize(("dtype0", "dtype1", "dtype2"), TRIPLE_DTYPES)
+def test_sum_twice(dtype0, dtype1, dtype2):
+    t0, t1, t2 = make_tensor(dtype0), make_tensor(dtype1), make_tensor(dtype2)
+    expected = (1 - BETA) * ((1 - ALPHA) * t0 + ALPHA * t1) + BETA * t2
+    assert_matches_baseline(_sum_twice(t0, t1, t2, ALPHA, BETA), expected)
+
+
+@pytest.mark.parametrize(("dtype0", "dtype1", "dtype2"), TRIPLE_DTYPES)
+def test_triple_sum(dtype0, dtype1, dtype2):
+    t0, t1, t2 = make_tensor(dtype0), make_tensor(dtype1), make_tensor(dtype2)
+    expected = (1 - ALPHA - BETA) * t0 + ALPHA * t1 + BETA * t2
+    assert_matches_baseline(_triple_sum(t0, t1, t2, ALPHA, BETA), expected)
+
+
+def test_fix_nai_keys():
+    nai_key = "cond_stage_model.transformer.encoder.layers.0.mlp.fc1.weight"
+    fixed_key = (
+        "cond_stage_model.transformer.text_model.encoder.layers.0.mlp.fc1.weight"
+    )
+    t = torch.zeros(2)
+    model = {nai_key: t, "model.diffusion_model.out.0.weight": torch.ones(2)}
+    result = fix_nai_keys(model)
+    assert nai_key not in result
+    assert result[fixed_key] is t
+    assert "model.diffusion_model.out.0.weight" in result
+
+
+def test_fix_nai_keys_noop():
+    model = {
+        "cond_stage_model.transformer.text_model.encoder.layers.0.mlp.fc1.weight": torch.zeros(
+            2
+        ),
+        "model.diffusion_model.out.0.weight": torch.ones(2),
+    }
+    result = fix_nai_keys(dict(model))
+    assert result.keys() == model.keys()
+
+
+def test_fix_nai_keys_embeddings():
+    nai_key = "cond_stage_model.transformer.embeddings.position_ids"
+    fixed_key = "cond_stage_model.transformer.text_model.embeddings.position_ids"
+    t = torch.zeros(2)
+    result = fix_nai_keys({nai_key: t})
+    assert nai_key not in result
+    assert result[fixed_key] is t
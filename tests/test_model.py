@@ -0,0 +1,53 @@
+import safetensors.torch
+import torch
+
+from sd_webui_bayesian_merger.model import LazyStateDict
+
+DISK_KEY = "model.diffusion_model.out.0.weight"
+NAI_KEY = "cond_stage_model.transformer.encoder.layers.0.mlp.fc1.weight"
+FIXED_KEY = "cond_stage_model.transformer.text_model.encoder.layers.0.mlp.fc1.weight"
+
+
+def write_model(path):
+    tensors = {
+        DISK_KEY: torch.arange(4, dtype=torch.float32),
+        NAI_KEY: torch.ones(2),
+    }
+    safetensors.torch.save_file(tensors, str(path))
+    return tensors
+
+
+def test_lazy_state_dict_fixes_keys(tmp_path):
+    path = tmp_path / "model.safetensors"
+    tensors = write_model(path)
+    sd = LazyStateDict(path, "cpu")
+    assert NAI_KEY not in sd
+    assert FIXED_KEY in sd
+    assert torch.equal(sd[FIXED_KEY], tensors[NAI_KEY])
+
+
+def test_lazy_state_dict_pop(tmp_path):
+    path = tmp_path / "model.safetensors"
+    tensors = write_model(path)
+    sd = LazyStateDict(path, "cpu")
+
+    # pop keeps Mapping semantics: disk-backed keys are materialized
+    popped = sd.pop(DISK_KEY)
+    assert torch.equal(popped, tensors[DISK_KEY])
+    assert DISK_KEY not in sd
+    assert sd.pop(DISK_KEY, None) is None
+
+    overlay = torch.zeros(3)
+    sd[FIXED_KEY] = overlay
+    assert sd.pop(FIXED_KEY) is overlay
+    assert FIXED_KEY not in sd
+
+
+def test_lazy_state_dict_discard(tmp_path):
+    path = tmp_path / "model.safetensors"
+    write_model(path)
+    sd = LazyStateDict(path, "cpu")
+    sd.discard(DISK_KEY)
+    sd.discard("not.a.key")
+    assert DISK_KEY not in sd
+    assert FIXED_KEY in sd